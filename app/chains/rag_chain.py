@@ -1,22 +1,48 @@
-from typing import TypedDict, Annotated, Sequence
+from typing import TypedDict, Annotated, AsyncIterator, Sequence
+from collections import OrderedDict
+import asyncio
+import hashlib
 import operator
 import logging
+import time
 
 from langgraph.graph import StateGraph
 from langchain_community.chat_models import ChatOllama
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# System prompts hold only invariant instructions so they form a byte-identical
+# prefix across calls, letting Ollama reuse the cached KV state for it.
+# Everything dynamic goes in the user message at the tail.
+PLAN_SYSTEM = (
+    "You are a helpful assistant. Use the conversation history to understand context.\n"
+    "Break the current task into clear, logical steps. Just list the steps, one per "
+    "line, do not answer yet. Never exceed the maximum number of steps allowed."
+)
+EXECUTE_SYSTEM = (
+    "You are a helpful assistant. Perform the step given by the user.\n"
+    "Provide a concise and accurate result."
+)
+FINALIZE_SYSTEM = (
+    "You are a helpful assistant. You are given the user's original task, the steps "
+    "taken to solve it and their results.\n"
+    "Write a clear, natural, and helpful final response to the user."
+)
+
 
 class SmartChatAgent:
     """
     A smart chat agent that breaks down user questions into multiple steps internally,
     reasons through them, and returns a final answer — while maintaining natural chat history.
     Intermediate reasoning steps are NOT saved in the chat history.
+
+    Planned steps are submitted as a single batch, so the Ollama server should be started
+    with OLLAMA_NUM_PARALLEL >= max_plan_steps for them to actually overlap.
     """
 
     def __init__(
@@ -25,11 +51,29 @@ class SmartChatAgent:
         temperature=0.3,
         max_chat_history=4,
         max_plan_steps=4,
+        answer_cache_size=256,
+        plan_cache_size=256,
+        plan_cache_ttl=3600,
+        llm=None,
+        answer_cache=None,
+        plan_cache=None,
     ):
         self.max_chat_history = max_chat_history
         self.max_plan_steps = max_plan_steps
-        self.llm = ChatOllama(model=model_name, temperature=temperature)
+        self.answer_cache_size = answer_cache_size
+        self.plan_cache_size = plan_cache_size
+        self.plan_cache_ttl = plan_cache_ttl  # Seconds before a cached plan goes stale
+        # A shared llm lets several agents reuse one client and its connection pool
+        self.llm = llm or ChatOllama(model=model_name, temperature=temperature)
         self._history = []  # Stores only user + final AI messages
+        # LRU of final answers keyed by (question, context) strings, not by self,
+        # since _history keeps mutating. Pass the same OrderedDict to several agents
+        # to share it: the key carries the context, so sessions never see each
+        # other's follow-ups, only identical questions asked with identical history.
+        self._answer_cache = OrderedDict() if answer_cache is None else answer_cache
+        # LRU of (created_at, plan, steps) keyed by a hash of the normalized task +
+        # context, shareable the same way
+        self._plan_cache = OrderedDict() if plan_cache is None else plan_cache
         self._build_graph()
 
     def _build_graph(self):
@@ -39,26 +83,59 @@ class SmartChatAgent:
             task: str
             context: str
             plan: str
-            steps: Annotated[Sequence[str], operator.add]
-            results: Annotated[Sequence[str], operator.add]
+            steps: Sequence[str]
+            # Step index -> result, merged by key instead of re-concatenating lists
+            results: Annotated[dict[int, str], operator.or_]
             final_answer: str
 
-        def plan_task(state: AgentState):
-            prompt = ChatPromptTemplate.from_template(
-                """
-        You are a helpful assistant. Use the conversation history to understand context.
-
-        Previous Conversation:
-        {context}
+        plan_chain = (
+            ChatPromptTemplate.from_messages(
+                [
+                    ("system", PLAN_SYSTEM),
+                    (
+                        "user",
+                        "Previous Conversation:\n{context}\n\n"
+                        "Current Task: {task}\n"
+                        "Maximum Steps Allowed: {max_steps}",
+                    ),
+                ]
+            )
+            | self.llm
+            | StrOutputParser()
+        )
+        execute_chain = (
+            ChatPromptTemplate.from_messages(
+                [("system", EXECUTE_SYSTEM), ("user", "Step: {step}")]
+            )
+            | self.llm
+            | StrOutputParser()
+        )
+        finalize_chain = (
+            ChatPromptTemplate.from_messages(
+                [
+                    ("system", FINALIZE_SYSTEM),
+                    (
+                        "user",
+                        "Original Task: {task}\n\n"
+                        "Steps Taken:\n{steps}\n\n"
+                        "Results:\n{results}",
+                    ),
+                ]
+            )
+            | self.llm
+            | StrOutputParser()
+        )
 
-        Current Task: {task}
+        async def plan_task(state: AgentState):
+            key = self._plan_cache_key(state["task"], state["context"])
+            cached = self._plan_cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.plan_cache_ttl:
+                self._plan_cache.move_to_end(key)
+                _, plan, steps = cached
+                logger.info("⚡ Plan cache hit, skipping the planning call.")
+                return {"plan": plan, "steps": list(steps)}
 
-        Break this task into clear, logical steps. Just list the steps, do not answer yet.
-        Maximum Steps Allowed: {max_steps}
-                """
-            )
-            chain = prompt | self.llm | StrOutputParser()
-            plan = chain.invoke(
+            plan = await plan_chain.ainvoke(
                 {
                     "task": state["task"],
                     "context": state["context"],
@@ -73,45 +150,37 @@ class SmartChatAgent:
             logger.info("🧠 Plan Generated:")
             for i, step in enumerate(steps, 1):
                 logger.info(f"  {i}. {step}")
+
+            self._plan_cache[key] = (time.monotonic(), plan, tuple(steps))
+            self._plan_cache.move_to_end(key)
+            while len(self._plan_cache) > self.plan_cache_size:
+                self._plan_cache.popitem(last=False)
             return {"plan": plan, "steps": steps}
 
-        def execute_step(state: AgentState):
-            current_step_index = len(state["results"])
-            current_step = state["steps"][current_step_index]
-            logger.info(f"🛠️ Executing Step {current_step_index + 1}: {current_step}")
-            prompt = ChatPromptTemplate.from_template(
-                "Perform this step: {step}\nProvide a concise and accurate result."
+        async def execute_all_steps(state: AgentState):
+            # Steps don't depend on each other's results, so submit them as one batch
+            for i, step in enumerate(state["steps"], 1):
+                logger.info(f"🛠️ Executing Step {i}: {step}")
+            results = await execute_chain.abatch(
+                [{"step": step} for step in state["steps"]],
+                config={"max_concurrency": self.max_plan_steps},
             )
-            chain = prompt | self.llm | StrOutputParser()
-            result = chain.invoke({"step": current_step})
-            logger.info(f"✅ Result: {result}")
-            return {"results": [result]}
-
-        def should_continue(state: AgentState):
-            return "continue" if len(state["results"]) < len(state["steps"]) else "end"
+            for i, result in enumerate(results, 1):
+                logger.info(f"✅ Result {i}: {result}")
+            return {"results": dict(enumerate(results))}
 
-        def finalize_answer(state: AgentState):
+        async def finalize_answer(state: AgentState, config: RunnableConfig):
             logger.info("📝 Finalizing Answer...")
-            prompt = ChatPromptTemplate.from_template(
-                """
-Original Task: {task}
-
-Steps Taken:
-{steps}
-
-Results:
-{results}
-
-Write a clear, natural, and helpful final response to the user.
-                """
-            )
-            chain = prompt | self.llm | StrOutputParser()
-            final_answer = chain.invoke(
+            # Forward config so the graph's token stream sees this call's tokens
+            final_answer = await finalize_chain.ainvoke(
                 {
                     "task": state["task"],
                     "steps": "\n".join(state["steps"]),
-                    "results": "\n".join(state["results"]),
-                }
+                    "results": "\n".join(
+                        result for _, result in sorted(state["results"].items())
+                    ),
+                },
+                config,
             )
             logger.info("✅ Final Answer Generated.")
             return {"final_answer": final_answer}
@@ -119,20 +188,27 @@ Write a clear, natural, and helpful final response to the user.
         # Build graph
         workflow = StateGraph(AgentState)
         workflow.add_node("plan_task", plan_task)
-        workflow.add_node("execute_step", execute_step)
+        workflow.add_node("execute_all_steps", execute_all_steps)
         workflow.add_node("finalize_answer", finalize_answer)
 
         workflow.set_entry_point("plan_task")
-        workflow.add_edge("plan_task", "execute_step")
-        workflow.add_conditional_edges(
-            "execute_step",
-            should_continue,
-            {"continue": "execute_step", "end": "finalize_answer"},
-        )
+        workflow.add_edge("plan_task", "execute_all_steps")
+        workflow.add_edge("execute_all_steps", "finalize_answer")
         workflow.add_edge("finalize_answer", "__end__")
 
         self.graph = workflow.compile()
 
+    @staticmethod
+    def _plan_cache_key(task: str, context: str) -> bytes:
+        """
+        Hash task + context after normalizing case and whitespace only. Punctuation is
+        kept: signs, operators and decimal points ("-50", "1.5%") change the question.
+        """
+        normalized = "\x00".join(
+            " ".join(text.casefold().split()) for text in (task, context)
+        )
+        return hashlib.blake2b(normalized.encode(), digest_size=8).digest()
+
     def _get_context(self) -> str:
         """Format chat history as plain text context."""
         return "\n".join(
@@ -144,7 +220,37 @@ Write a clear, natural, and helpful final response to the user.
             ]
         )
 
-    def answer_user_query(self, question: str) -> str:
+    @staticmethod
+    def _initial_state(question: str, context: str) -> dict:
+        return {
+            "task": question,
+            "context": context,
+            "steps": [],
+            "results": {},
+            "plan": "",
+            "final_answer": "",
+        }
+
+    def _cache_answer(self, key: tuple, final_answer: str):
+        self._answer_cache[key] = final_answer
+        if len(self._answer_cache) > self.answer_cache_size:
+            self._answer_cache.popitem(last=False)
+
+    async def _run_graph(self, question: str, context: str) -> str:
+        """Run the reasoning graph, reusing the cached answer for a repeated question + context."""
+        key = (question, context)
+        if key in self._answer_cache:
+            self._answer_cache.move_to_end(key)
+            logger.info("⚡ Answer cache hit, skipping the reasoning graph.")
+            return self._answer_cache[key]
+
+        result = await self.graph.ainvoke(self._initial_state(question, context))
+        final_answer = result["final_answer"]
+
+        self._cache_answer(key, final_answer)
+        return final_answer
+
+    async def answer_user_query(self, question: str) -> str:
         """
         Answer the user's question. Returns the final answer after multi-step reasoning.
         Only the user question and final answer are saved in chat history.
@@ -153,29 +259,53 @@ Write a clear, natural, and helpful final response to the user.
         self._history.append(HumanMessage(content=question))
 
         # Run reasoning with context
-        result = self.graph.invoke(
-            {
-                "task": question,
-                "context": self._get_context(),
-                "steps": [],
-                "results": [],
-                "plan": "",
-                "final_answer": "",
-            }
-        )
-
-        final_answer = result["final_answer"]
+        final_answer = await self._run_graph(question, self._get_context())
 
         # Save only the final answer (not intermediate steps)
         self._history.append(AIMessage(content=final_answer))
 
         return final_answer
 
+    async def astream_final(self, question: str) -> AsyncIterator[str]:
+        """
+        Like answer_user_query, but yields the final answer's tokens as they are generated.
+        Planning and step execution run as usual; only the finalize call is streamed.
+        The full answer is saved to chat history once the stream ends. If the stream is
+        closed early (client disconnect) or the graph raises, the partial answer is saved
+        instead, or the question is dropped if nothing was generated yet.
+        """
+        user_message = HumanMessage(content=question)
+        self._history.append(user_message)
+        context = self._get_context()
+        key = (question, context)
+        tokens = []
+
+        try:
+            if key in self._answer_cache:
+                self._answer_cache.move_to_end(key)
+                logger.info("⚡ Answer cache hit, skipping the reasoning graph.")
+                tokens.append(self._answer_cache[key])
+                yield tokens[0]
+            else:
+                async for chunk, metadata in self.graph.astream(
+                    self._initial_state(question, context), stream_mode="messages"
+                ):
+                    if metadata.get("langgraph_node") == "finalize_answer" and chunk.content:
+                        tokens.append(chunk.content)
+                        yield chunk.content
+                # Only complete answers are cached
+                self._cache_answer(key, "".join(tokens))
+        finally:
+            if tokens:
+                self._history.append(AIMessage(content="".join(tokens)))
+            elif self._history and self._history[-1] is user_message:
+                self._history.pop()
+
 
 # ========================
 # Example Usage
 # ========================
-if __name__ == "__main__":
+async def main():
     logger.info("🧠 Initializing Smart Chat Agent...")
     agent = SmartChatAgent(
         model_name="qwen:1.8b", max_chat_history=2, max_plan_steps=2
@@ -183,17 +313,17 @@ if __name__ == "__main__":
 
     # First question
     logger.info("User: What is the capital of France?")
-    response1 = agent.answer_user_query("What is the capital of France?")
+    response1 = await agent.answer_user_query("What is the capital of France?")
     logger.info(f"Agent: {response1}")
 
     # Second (follow-up)
     logger.info("User: What was the previous question?")
-    response2 = agent.answer_user_query("What was the previous question?")
+    response2 = await agent.answer_user_query("What was the previous question?")
     logger.info(f"Agent: {response2}")
 
     # Third (comparison)
     logger.info("User: Which country has more influence on art and design?")
-    response3 = agent.answer_user_query("Which country has more influence on art and design?")
+    response3 = await agent.answer_user_query("Which country has more influence on art and design?")
     logger.info(f"Agent: {response3}")
 
     # Optional: print full chat history
@@ -201,3 +331,7 @@ if __name__ == "__main__":
     for msg in agent._history:
         role = "👤 User" if isinstance(msg, HumanMessage) else "🤖 Agent"
         logger.info(f"{role}: {msg.content}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Int8-quantized ONNX Runtime drop-in for the SentenceTransformer embedding model.
+
+One-time setup (run from app/ingestion). Export and quantization need the setup-only
+packages `optimum[exporters]` and `onnx`; encoding needs just onnxruntime + transformers:
+    pip install "optimum[exporters]" onnx
+    optimum-cli export onnx --model sentence-transformers/all-distilroberta-v1 onnx_model/
+    python onnx_encoder.py    # writes onnx_model/model.int8.onnx
+"""
+import os
+from typing import List, Union
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+ONNX_MODEL_DIR = "onnx_model"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+
+
+class OnnxSentenceEncoder:
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, model_file: str = QUANTIZED_MODEL_FILE, max_seq_length: int = 512):
+        """
+        Load the tokenizer and the quantized ONNX model exported to model_dir.
+        
+        Args:
+            model_dir: Directory produced by `optimum-cli export onnx`
+            model_file: ONNX file inside model_dir to run
+            max_seq_length: Inputs are truncated to this many model tokens
+        """
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        # optimum exports sentence-transformers checkpoints with a `token_embeddings`
+        # output and plain transformers ones with `last_hidden_state`
+        output_names = [node.name for node in self.session.get_outputs()]
+        self.output_name = next(
+            (name for name in ("token_embeddings", "last_hidden_state") if name in output_names),
+            output_names[0],
+        )
+        self.max_seq_length = max_seq_length
+    
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 64,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        """
+        Embed sentences with mean pooling over the token embeddings, mirroring
+        SentenceTransformer.encode (always returns numpy; show_progress_bar is ignored).
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {name: array for name, array in inputs.items() if name in self.input_names}
+            token_embeddings = self.session.run([self.output_name], feeds)[0]
+            
+            # Mean pooling over non-padding tokens
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            batches.append(summed / np.clip(mask.sum(axis=1), 1e-9, None))
+        
+        embeddings = np.concatenate(batches).astype(np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        
+        return embeddings[0] if single else embeddings
+
+
+def quantize_model(model_dir: str = ONNX_MODEL_DIR) -> str:
+    """Apply dynamic int8 quantization to the exported model.onnx and return the output path."""
+    # Imported here: the quantizer needs the `onnx` package, which encoding does not
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+    quantize_dynamic(
+        os.path.join(model_dir, "model.onnx"), output_path, weight_type=QuantType.QInt8
+    )
+    return output_path
+
+
+if __name__ == "__main__":
+    print(f"✅ Quantized model written to {quantize_model()}")
@@ -1,10 +1,14 @@
 import os
 import re
-from PyPDF2 import PdfReader
-from typing import List, Dict
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import pypdfium2 as pdfium
+from typing import Dict, Iterator, List, Tuple
 import tiktoken
 
 MONTH_PATTERN = r"(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}"
+MONTH_RE = re.compile(MONTH_PATTERN, re.IGNORECASE)
 
 class PDFChunker:
     def __init__(self, chunk_size: int = 350, overlap: int = 75, encoding_name: str = "cl100k_base"):
@@ -16,22 +20,45 @@ class PDFChunker:
             overlap: Overlap between chunks in tokens (50-100 recommended)
             encoding_name: Tiktoken encoding to use for token counting
         """
+        # Windows advance by chunk_size - overlap tokens, which must be positive
+        if not 0 <= overlap < chunk_size:
+            raise ValueError(
+                f"overlap must be in [0, chunk_size), got overlap={overlap}, chunk_size={chunk_size}"
+            )
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.encoding_name = encoding_name
         self.encoding = tiktoken.get_encoding(encoding_name)
     
+    def __getstate__(self) -> Dict:
+        """Drop the tiktoken encoding when pickling the chunker for worker processes."""
+        state = self.__dict__.copy()
+        del state["encoding"]
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        """Reload the tiktoken encoding inside the worker process."""
+        self.__dict__.update(state)
+        self.encoding = tiktoken.get_encoding(self.encoding_name)
+    
     def count_tokens(self, text: str) -> int:
         """Count tokens in text using tiktoken."""
         return len(self.encoding.encode(text))
     
     def parse_pdf(self, file_path: str) -> str:
-        """Extract full text from a PDF using PyPDF2."""
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-            text += "\n"
-        return text
+        """Extract full text from a PDF using PDFium (native parser and text extraction)."""
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            pages = []
+            for i in range(len(pdf)):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_range() + "\n")
+                textpage.close()
+                page.close()
+            return "".join(pages)
+        finally:
+            pdf.close()
     
     def split_text_by_tokens(self, text: str, preserve_paragraphs: bool = True) -> List[str]:
         """
@@ -39,52 +66,55 @@ class PDFChunker:
         
         Args:
             text: Input text to split
-            preserve_paragraphs: Try to split at paragraph boundaries when possible
+            preserve_paragraphs: Kept for backwards compatibility; chunks are cut on token boundaries
         
         Returns:
             List of text chunks
         """
-        # Split text into sentences for better chunking boundaries
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        # Tokenize once and slide a window over the token ids
+        ids = self.encoding.encode(text)
         chunks = []
-        current_chunk = ""
-        current_tokens = 0
-        
-        i = 0
-        while i < len(sentences):
-            sentence = sentences[i]
-            sentence_tokens = self.count_tokens(sentence)
-            
-            # If adding this sentence would exceed chunk size
-            if current_tokens + sentence_tokens > self.chunk_size and current_chunk:
-                # Save current chunk
-                chunks.append(current_chunk.strip())
-                
-                # Start new chunk with overlap
-                overlap_text = self.get_overlap_text(current_chunk, self.overlap)
-                current_chunk = overlap_text + " " + sentence if overlap_text else sentence
-                current_tokens = self.count_tokens(current_chunk)
-            else:
-                # Add sentence to current chunk
-                current_chunk += " " + sentence if current_chunk else sentence
-                current_tokens += sentence_tokens
-            
-            i += 1
-        
-        # Add the last chunk if it has content
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
+        for start, end in self.token_windows(len(ids)):
+            chunk = self.encoding.decode(ids[start:end]).strip()
+            if chunk:
+                chunks.append(chunk)
         return chunks
     
-    def get_overlap_text(self, text: str, overlap_tokens: int) -> str:
-        """Get the last N tokens from text for overlap."""
-        tokens = self.encoding.encode(text)
-        if len(tokens) <= overlap_tokens:
-            return text
+    def token_windows(self, n_tokens: int) -> Iterator[Tuple[int, int]]:
+        """Return an iterator of (start, end) offsets of chunk_size token windows overlapping by `overlap` tokens."""
+        if n_tokens <= 0:
+            return iter(())
+        
+        # Window k starts at k * stride; the last one is the first to reach n_tokens.
+        # Computed with range arithmetic so no per-window Python loop runs.
+        stride = self.chunk_size - self.overlap
+        last_start = max(0, -(-(n_tokens - self.chunk_size) // stride)) * stride
+        starts = range(0, last_start + 1, stride)
+        ends = chain(range(self.chunk_size, last_start + self.chunk_size, stride), (n_tokens,))
+        return zip(starts, ends)
+    
+    def clean_month_text(self, month_text: str, month_str: str) -> str:
+        """Remove the month header and collapse whitespace in a month's text."""
+        clean_text = re.sub(f"^{re.escape(month_str)}", "", month_text)
+        return " ".join(clean_text.split())
+    
+    def chunk_token_ids(self, ids: List[int], month_str: str, start: int = 0, end: int = None) -> List[Dict]:
+        """
+        Cut the token range ids[start:end] of a month into chunk dictionaries.
         
-        overlap_token_ids = tokens[-overlap_tokens:]
-        return self.encoding.decode(overlap_token_ids)
+        Only the window offsets are computed up front; each chunk is decoded once,
+        straight from the shared id list, without copying the month's range.
+        """
+        end = len(ids) if end is None else end
+        chunks = []
+        for chunk_index, (window_start, window_end) in enumerate(self.token_windows(end - start)):
+            chunks.append({
+                "month": month_str,
+                "chunk_id": f"{month_str}_chunk_{chunk_index + 1}",
+                "text": self.encoding.decode(ids[start + window_start:start + window_end]).strip(),
+                "token_count": window_end - window_start,
+            })
+        return chunks
     
     def chunk_monthly_data(self, month_text: str, month_str: str) -> List[Dict]:
         """
@@ -97,100 +127,37 @@ class PDFChunker:
         Returns:
             List of chunk dictionaries
         """
-        chunks = []
-        
         # Remove the month header from the text to avoid duplication
-        clean_text = re.sub(f"^{re.escape(month_str)}", "", month_text).strip()
+        clean_text = self.clean_month_text(month_text, month_str)
         
         if not clean_text:
-            return chunks
+            return []
         
-        # Split into words for more granular control
-        words = clean_text.split()
-        
-        if not words:
-            return chunks
-        
-        chunk_index = 0
-        start_idx = 0
-        
-        while start_idx < len(words):
-            # Build chunk starting from start_idx
-            current_chunk_words = []
-            current_tokens = 0
-            
-            # Add words until we reach target chunk size
-            for i in range(start_idx, len(words)):
-                word = words[i]
-                # Test adding this word
-                test_chunk = " ".join(current_chunk_words + [word])
-                test_tokens = self.count_tokens(test_chunk)
-                
-                if test_tokens <= self.chunk_size:
-                    current_chunk_words.append(word)
-                    current_tokens = test_tokens
-                else:
-                    # We've reached the size limit
-                    break
-            
-            # Create the chunk
-            if current_chunk_words:
-                chunk_text = " ".join(current_chunk_words)
-                chunks.append({
-                    "month": month_str,
-                    "chunk_id": f"{month_str}_chunk_{chunk_index + 1}",
-                    "text": chunk_text,
-                    "token_count": current_tokens,
-                })
-                
-                chunk_index += 1
-                
-                # Calculate overlap for next chunk
-                if start_idx + len(current_chunk_words) < len(words):  # Not the last chunk
-                    # Find the overlap point (75 tokens from the end of current chunk)
-                    overlap_words = []
-                    overlap_tokens = 0
-                    
-                    # Work backwards from end of current chunk to find overlap
-                    for j in range(len(current_chunk_words) - 1, -1, -1):
-                        test_overlap = " ".join(current_chunk_words[j:])
-                        test_tokens = self.count_tokens(test_overlap)
-                        
-                        if test_tokens <= self.overlap:
-                            overlap_words = current_chunk_words[j:]
-                            overlap_tokens = test_tokens
-                        else:
-                            break
-                    
-                    # Next chunk starts with overlap
-                    if overlap_words:
-                        # Find where overlap ends in the word list
-                        overlap_length = len(overlap_words)
-                        start_idx = start_idx + len(current_chunk_words) - overlap_length
-                    else:
-                        start_idx = start_idx + len(current_chunk_words)
-                else:
-                    # Last chunk, we're done
-                    break
-            else:
-                # If we couldn't add any words, move forward to avoid infinite loop
-                start_idx += 1
-        
-        return chunks
+        return self.chunk_token_ids(self.encoding.encode(clean_text), month_str)
 
     def processing_by_month(self, text: str) -> List[Dict]:
         """Split text by month-year headings, then chunk each month's data."""
-        matches = list(re.finditer(MONTH_PATTERN, text, re.IGNORECASE))
+        # Tokenize the whole document once; each month becomes a range of token ids
+        text = " ".join(text.split())
+        ids = self.encoding.encode(text)
+        # offsets[k] is the character offset at which token k starts, ends[k] where it stops
+        _, offsets = self.encoding.decode_with_offsets(ids)
+        ends = offsets[1:] + [len(text)]
+        matches = list(MONTH_RE.finditer(text))
         all_chunks = []
 
         for i, match in enumerate(matches):
-            start = match.start()
             end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
             month_str = match.group(0)
-            month_text = text[start:end].strip()
+            
+            # Map character offsets to token offsets, leaving out the month header.
+            # The next heading's token carries its leading space (" February"), so it
+            # starts before `end`; only tokens that stop at or before `end` are kept.
+            token_start = bisect_left(offsets, match.end())
+            token_end = max(token_start, bisect_right(ends, end))
             
             # Chunk this month's data
-            month_chunks = self.chunk_monthly_data(month_text, month_str)
+            month_chunks = self.chunk_token_ids(ids, month_str, token_start, token_end)
             all_chunks.extend(month_chunks)
             
             if month_chunks:
@@ -212,8 +179,13 @@ class PDFChunker:
         print(f"  📄 Total chunks created: {len(monthly_chunks)}")
         return monthly_chunks
     
-    def parse_all_pdfs_by_month(self, folder_path: str) -> List[Dict]:
-        """Read all PDFs in a folder and return monthly chunks with token-based splitting."""
+    def parse_all_pdfs_by_month(self, folder_path: str, max_workers: int = None) -> List[Dict]:
+        """
+        Read all PDFs in a folder and return monthly chunks with token-based splitting.
+        
+        Files are independent and CPU-bound, so they are processed in a pool of worker
+        processes (max_workers defaults to min(8, cpu count)).
+        """
         all_chunks = []
         
         pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".pdf")]
@@ -222,18 +194,23 @@ class PDFChunker:
             print("No PDF files found in the specified folder.")
             return all_chunks
         
-        for file in pdf_files:
-            file_path = os.path.join(folder_path, file)
+        file_paths = [os.path.join(folder_path, file) for file in pdf_files]
+        max_workers = max_workers or min(8, os.cpu_count() or 1)
+        
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.process_single_pdf, path) for path in file_paths]
             
-            try:
-                monthly_chunks = self.process_single_pdf(file_path)
-                all_chunks.extend(monthly_chunks)
-                
-                total_tokens = sum(chunk["token_count"] for chunk in monthly_chunks)
-                print(f"✅ {file} → {len(monthly_chunks)} chunks, {total_tokens} total tokens")
-                
-            except Exception as e:
-                print(f"❌ Error processing {file}: {str(e)}")
+            # Collect in file order so the output is deterministic
+            for file, future in zip(pdf_files, futures):
+                try:
+                    monthly_chunks = future.result()
+                    all_chunks.extend(monthly_chunks)
+                    
+                    total_tokens = sum(chunk["token_count"] for chunk in monthly_chunks)
+                    print(f"✅ {file} → {len(monthly_chunks)} chunks, {total_tokens} total tokens")
+                    
+                except Exception as e:
+                    print(f"❌ Error processing {file}: {str(e)}")
         
         return all_chunks
     
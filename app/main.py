@@ -1,9 +1,25 @@
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from collections import deque
+from collections import OrderedDict, deque
+import orjson
+from langchain_community.chat_models import ChatOllama
 from app.chains.rag_chain import SmartChatAgent
 
+
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """GZip responses, except Server-Sent Event streams, which gzip would buffer."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/chat/stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 app = FastAPI(title="RAG4Finance Chat Backend")
 
 # Allow frontend (Streamlit) to connect
@@ -14,15 +30,67 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-bot_obj = SmartChatAgent(
-    model_name="qwen:1.8b", temperature=0.8, max_chat_history=10, max_plan_steps=2
-)
-# Keep only last 20 messages (10 exchanges)
-chat_history = deque(maxlen=20)
+# Chat replies and history are highly compressible text
+app.add_middleware(NonStreamingGZipMiddleware, minimum_size=512)
+
+# One client shared by every session's agent: reuses the HTTP connection pool, and
+# the identical system prompts across sessions keep the server's prefix cache hot
+_SHARED_LLM = ChatOllama(model="qwen:1.8b", temperature=0.8)
+# Answer and plan caches shared by every session's agent, so the same question asked
+# with the same history (e.g. a common first question) is answered once server-wide
+_SHARED_ANSWER_CACHE = OrderedDict()
+_SHARED_PLAN_CACHE = OrderedDict()
+MAX_SESSIONS = 256
+# session id -> {"agent": SmartChatAgent, "history": deque}, least recently used first
+sessions = OrderedDict()
+
+
+def get_session(session_id: str) -> dict:
+    """Return the agent + chat history for a session, evicting the least recently used."""
+    session = sessions.get(session_id)
+    if session is None:
+        session = {
+            "agent": SmartChatAgent(
+                llm=_SHARED_LLM,
+                max_chat_history=10,
+                max_plan_steps=2,
+                answer_cache=_SHARED_ANSWER_CACHE,
+                plan_cache=_SHARED_PLAN_CACHE,
+            ),
+            # Keep only last 20 messages (10 exchanges)
+            "history": deque(maxlen=20),
+            "turns": 0,  # Messages received since the session was (re)created
+        }
+        sessions[session_id] = session
+        if len(sessions) > MAX_SESSIONS:
+            sessions.popitem(last=False)
+    else:
+        sessions.move_to_end(session_id)
+    return session
 
 
 class ChatMessage(BaseModel):
+    """
+    One chat turn. Clients send only the new message, never the whole conversation:
+    the server keeps each session's agent and history (see get_session) keyed by
+    session_id, so earlier turns are not re-sent or re-processed. Idle sessions are
+    evicted LRU-first once MAX_SESSIONS is exceeded and then start fresh.
+
+    session_id: client-generated id; falls back to the X-Session-ID header
+    since_index: index of this message in the client's own history. A positive index
+        on a session's first message means the server lost the earlier turns (evicted
+        or restarted); the reply then reports `context_reset` (see context_reset)
+    """
+
     message: str
+    session_id: Optional[str] = None
+    since_index: Optional[int] = None
+
+
+def context_reset(session: dict, msg: ChatMessage) -> bool:
+    """Count the turn; True if the client has earlier turns this session never saw."""
+    session["turns"] += 1
+    return session["turns"] == 1 and bool(msg.since_index)
 
 
 @app.get("/")
@@ -31,23 +99,66 @@ def root():
 
 
 @app.post("/chat")
-def chat_endpoint(msg: ChatMessage):
+async def chat_endpoint(msg: ChatMessage, x_session_id: str = Header("default")):
+    session = get_session(msg.session_id or x_session_id)
+    chat_history = session["history"]
+    reset = context_reset(session, msg)
+
     # Store user message
     chat_history.append({"role": "user", "content": msg.message})
 
-    # Get response from SmartChatAgent
-    # TODO: Make User configurable p3
-
-    bot_reply = bot_obj.answer_user_query(question=msg.message)
+    # Get response from the session's SmartChatAgent
+    bot_reply = await session["agent"].answer_user_query(question=msg.message)
     chat_history.append({"role": "assistant", "content": bot_reply})
 
-    return {"reply": bot_reply, "history": list(chat_history)}
+    return {"reply": bot_reply, "history": list(chat_history), "context_reset": reset}
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(msg: ChatMessage, x_session_id: str = Header("default")):
+    """
+    Stream the reply as Server-Sent Events: one `data: {"token": ...}` event per token,
+    preceded by a `data: {"context_reset": true}` event if the session lost earlier turns.
+    """
+    session = get_session(msg.session_id or x_session_id)
+    chat_history = session["history"]
+    reset = context_reset(session, msg)
+    user_entry = {"role": "user", "content": msg.message}
+    chat_history.append(user_entry)
+
+    async def event_stream():
+        tokens = []
+        if reset:
+            yield b'data: {"context_reset": true}\n\n'
+        stream = session["agent"].astream_final(msg.message)
+        try:
+            async for token in stream:
+                tokens.append(token)
+                yield b"data: " + orjson.dumps({"token": token}) + b"\n\n"
+        finally:
+            # Also runs when the client disconnects mid-stream: close the agent's stream
+            # so it records the partial answer, and mirror that here
+            await stream.aclose()
+            if tokens:
+                chat_history.append({"role": "assistant", "content": "".join(tokens)})
+            elif chat_history and chat_history[-1] is user_entry:
+                chat_history.pop()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/history")
-def get_history():
-    return {"history": list(chat_history)}
+def get_history(session_id: Optional[str] = None, x_session_id: str = Header("default")):
+    # Read-only: an unknown id must not create a session or evict a live one
+    session = sessions.get(session_id or x_session_id)
+    return {"history": list(session["history"]) if session else []}
 
 
 # Run backend:
 # uvicorn app.main:app --reload --port 8000
+# Planned steps run concurrently, so start Ollama with enough slots:
+# OLLAMA_NUM_PARALLEL=2 ollama serve
@@ -1,35 +1,321 @@
 # frontend/streamlit_app.py
+import hashlib
+import os
+import re
+import sqlite3
+import statistics
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8000")
+CHAT_STREAM_URL = f"{BACKEND_URL}/chat/stream"
+# Messages rendered eagerly; older ones go in a collapsed expander
+RECENT_MESSAGES = 50
+# Messages kept in session state (oldest evicted first); the full history lives
+# in the session's SQLite file
+MAX_MESSAGES = 100
+SESSIONS_DIR = ".sessions"
+# A message submitted again while its reply streams is queued by Streamlit (fragment
+# reruns don't preempt the running one) and only starts once that turn has finished;
+# the same message starting within this many seconds of it is that double submit
+DOUBLE_SUBMIT_WINDOW_S = 1.5
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One pooled keep-alive session, shared across script reruns."""
+    session = requests.Session()
+    session.headers.update({"Content-Type": "application/json"})
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Small thread pool for firing backend requests while the UI keeps rendering."""
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def smooth(tokens, interval: float = 0.08):
+    """Batch streamed tokens and flush them at most every `interval` seconds to limit redraws."""
+    buffer = []
+    last_flush = time.monotonic()
+    for token in tokens:
+        buffer.append(token)
+        if time.monotonic() - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = time.monotonic()
+    if buffer:
+        yield "".join(buffer)
+
+
+# Bounded so idle sessions don't each hold a file descriptor for the server's lifetime;
+# an evicted connection is closed once garbage collected and reopened on next use
+@st.cache_resource(max_entries=64, ttl=3600)
+def get_message_store(session_id: str) -> sqlite3.Connection:
+    """SQLite log of one session's messages (autocommit); rows are only updated while a reply streams."""
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    conn = sqlite3.connect(
+        os.path.join(SESSIONS_DIR, f"{session_id}.db"),
+        isolation_level=None,
+        check_same_thread=False,  # reruns may execute on different threads
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "seq INTEGER PRIMARY KEY, ts REAL, message_id TEXT, role TEXT, content TEXT, "
+        "ttfb_ms INTEGER, total_ms INTEGER, pending INTEGER DEFAULT 0)"
+    )
+    return conn
+
+
+def load_messages(limit: int, newest: bool = False) -> list:
+    """Read `limit` messages of this session from disk, oldest or newest first in time order."""
+    order = "DESC" if newest else "ASC"
+    rows = get_message_store(st.session_state.session_id).execute(
+        "SELECT message_id, role, content, ttfb_ms, total_ms, pending "
+        f"FROM messages ORDER BY seq {order} LIMIT ?",
+        (limit,),
+    ).fetchall()
+    if newest:
+        rows.reverse()
+    return [
+        {
+            "id": row[0],
+            "role": row[1],
+            "content": row[2],
+            "ttfb_ms": row[3],
+            "total_ms": row[4],
+            "pending": bool(row[5]),
+        }
+        for row in rows
+    ]
+
+
+def add_message(
+    role: str, content: str, ttfb_ms: int = None, total_ms: int = None, pending: bool = False
+) -> dict:
+    """
+    Append a chat message with a stable id, used as the key of its rendered container.
+    Assistant messages also carry their request latency (first token / full reply, in ms);
+    a pending one is still streaming and is filled in by save_message.
+    """
+    # Hash of role + initial content; session id + running index keep ids unique
+    # within and across sessions, even for repeated content
+    index = st.session_state.message_count
+    st.session_state.message_count += 1
+    message_id = hashlib.blake2b(
+        f"{st.session_state.session_id}|{index}|{role}|{content}".encode(), digest_size=8
+    ).hexdigest()
+    message = {
+        "id": message_id,
+        "role": role,
+        "content": content,
+        "ttfb_ms": ttfb_ms,
+        "total_ms": total_ms,
+        "pending": pending,
+    }
+    get_message_store(st.session_state.session_id).execute(
+        "INSERT INTO messages(ts, message_id, role, content, ttfb_ms, total_ms, pending) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (time.time(), message_id, role, content, ttfb_ms, total_ms, pending),
+    )
+    st.session_state.messages.append(message)  # deque evicts the oldest past MAX_MESSAGES
+    return message
+
+
+def save_message(message: dict):
+    """Write a message's current content, latency and pending flag back to disk."""
+    get_message_store(st.session_state.session_id).execute(
+        "UPDATE messages SET content = ?, ttfb_ms = ?, total_ms = ?, pending = ? "
+        "WHERE message_id = ?",
+        (
+            message["content"],
+            message["ttfb_ms"],
+            message["total_ms"],
+            message["pending"],
+            message["id"],
+        ),
+    )
+
+
+def save_as_streamed(chunks, message: dict):
+    """Pass chunks through, saving the partial reply after each one so a disconnect keeps it."""
+    for chunk in chunks:
+        message["content"] += chunk
+        save_message(message)
+        yield chunk
+
+
+def turn_key(prompt: str) -> str:
+    # Session id in the key so repeats are never matched across users
+    return hashlib.sha1(f"{st.session_state.session_id}|{prompt}".encode()).hexdigest()
+
+
+def is_repeat(prompt: str) -> bool:
+    """True if `prompt` is a double submit of the turn that just finished answering."""
+    last_turn = st.session_state.get("last_turn")
+    return (
+        last_turn is not None
+        and last_turn["key"] == turn_key(prompt)
+        and time.monotonic() - last_turn["ended_at"] < DOUBLE_SUBMIT_WINDOW_S
+    )
+
+
+def render_latency(ttfb_ms: int, total_ms: int):
+    st.caption(f"⏱ {ttfb_ms}ms first / {total_ms}ms total")
+
+
+def message_key(message: dict) -> str:
+    return f"msg_{message['id']}"
+
+
+def render_message(message: dict):
+    with st.container(key=message_key(message)):
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            if message.get("pending"):
+                st.caption("⚠️ Reply was interrupted")
+            elif message.get("total_ms") is not None:
+                render_latency(message["ttfb_ms"], message["total_ms"])
 
-BACKEND_URL = "http://localhost:8000"
 
 st.set_page_config(page_title="RAG4Finance Chat", layout="centered")
 st.title("💬 RAG4Finance Chat")
 
-# Initialize chat history in Streamlit session
+# Initialize chat history in Streamlit session. The session id is kept in the URL
+# so a reload picks the same history back up from disk.
+if "session_id" not in st.session_state:
+    session_id = st.query_params.get("sid", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", session_id):
+        session_id = uuid.uuid4().hex
+    st.session_state.session_id = session_id
+    st.query_params["sid"] = session_id
 if "messages" not in st.session_state:
-    st.session_state.messages = []
-
-# Display previous messages
-for msg in st.session_state.messages:
-    st.chat_message(msg["role"]).markdown(msg["content"])
-
-# Handle new user input
-if prompt := st.chat_input("Type your message..."):
-    # Show user message
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    st.chat_message("user").markdown(prompt)
-
-    # Send to backend
-    try:
-        response = requests.post(f"{BACKEND_URL}/chat", json={"message": prompt})
-        response.raise_for_status()
-        data = response.json()
-
-        bot_reply = data.get("reply", "Error: No reply from server")
-        st.session_state.messages.append({"role": "assistant", "content": bot_reply})
-        st.chat_message("assistant").markdown(bot_reply)
-
-    except Exception as e:
-        st.error(f"Error contacting backend: {e}")
+    store = get_message_store(st.session_state.session_id)
+    st.session_state.message_count = store.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    st.session_state.messages = deque(load_messages(MAX_MESSAGES, newest=True), maxlen=MAX_MESSAGES)
+    st.session_state.show_archived = False
+
+# Display previous messages, each under a stable key so unchanged ones are reused.
+# Only the latest ones are rendered eagerly, the rest sit in a collapsed expander;
+# messages that only exist on disk are read when asked for.
+messages = list(st.session_state.messages)
+older_messages = messages[:-RECENT_MESSAGES]
+archived_count = st.session_state.message_count - len(messages)
+if older_messages or archived_count:
+    with st.expander(f"Earlier messages ({archived_count + len(older_messages)})"):
+        if archived_count and st.session_state.show_archived:
+            for msg in load_messages(archived_count):
+                render_message(msg)
+        elif archived_count:
+            st.button(
+                f"Load {archived_count} older messages",
+                on_click=lambda: st.session_state.update(show_archived=True),
+            )
+        for msg in older_messages:
+            render_message(msg)
+for msg in messages[-RECENT_MESSAGES:]:
+    render_message(msg)
+st.session_state.rendered_count = st.session_state.message_count
+
+# Latency across the turns still in memory, to spot slow backend/LLM regressions
+ttfbs = [m["ttfb_ms"] for m in messages if m.get("ttfb_ms") is not None]
+if ttfbs:
+    st.sidebar.metric("Median time to first token", f"{statistics.median(ttfbs):.0f} ms")
+
+
+@st.fragment
+def chat_turn():
+    """
+    The message input plus the turns sent since the last full page run. Submitting a
+    message reruns only this fragment, so the history above is not rebuilt every turn.
+    """
+    new_count = st.session_state.message_count - st.session_state.rendered_count
+    if new_count:
+        for msg in list(st.session_state.messages)[-new_count:]:
+            render_message(msg)
+
+    # Handle new user input
+    prompt = st.chat_input("Type your message...")
+    if prompt and is_repeat(prompt):
+        # Don't spend another LLM generation on a message that is already being answered
+        st.toast("That message was already sent.")
+    elif prompt:
+        st.session_state.pop("last_turn", None)
+        reply = None
+        # Start the request first so its round-trip overlaps rendering the user message
+        request_start = time.perf_counter()
+        pending_response = get_executor().submit(
+            get_session().post,
+            CHAT_STREAM_URL,
+            # Only the new turn is sent; the backend keeps the rest of the session's state
+            data=orjson.dumps(
+                {
+                    "session_id": st.session_state.session_id,
+                    "message": prompt,
+                    "since_index": st.session_state.message_count,
+                }
+            ),
+            timeout=(3, 60),
+            stream=True,
+        )
+
+        # Show user message, under the same key it keeps when re-rendered as history
+        render_message(add_message("user", prompt))
+
+        # Render the reply as it streams in (Server-Sent Events)
+        try:
+            with pending_response.result() as response:
+                response.raise_for_status()
+                timings = {}
+
+                def token_stream():
+                    for line in response.iter_lines():
+                        if line.startswith(b"data: "):
+                            event = orjson.loads(line[6:])
+                            if event.get("context_reset"):
+                                # The backend dropped this session (since_index told it so)
+                                st.toast("The server lost the earlier conversation.")
+                                continue
+                            timings.setdefault("first_token", time.perf_counter())
+                            yield event.get("token", "")
+
+                # Saved up front and filled in as it streams, so a partial reply survives
+                reply = add_message("assistant", "", pending=True)
+                with st.container(key=message_key(reply)), st.chat_message("assistant"):
+                    st.write_stream(save_as_streamed(smooth(token_stream()), reply))
+                    request_end = time.perf_counter()
+                    reply["ttfb_ms"] = int(
+                        (timings.get("first_token", request_end) - request_start) * 1000
+                    )
+                    reply["total_ms"] = int((request_end - request_start) * 1000)
+                    render_latency(reply["ttfb_ms"], reply["total_ms"])
+
+            reply["pending"] = False
+            save_message(reply)
+
+        except Exception as e:
+            st.error(f"Error contacting backend: {e}")
+
+        finally:
+            # Recorded when the turn ends, since a queued duplicate only starts then. A turn
+            # that failed or was cut short with its reply pending can be retried right away.
+            if reply is not None and not reply["pending"]:
+                st.session_state.last_turn = {"key": turn_key(prompt), "ended_at": time.monotonic()}
+
+
+chat_turn()
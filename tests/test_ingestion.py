@@ -0,0 +1,73 @@
+import importlib.util
+import os
+import unittest
+
+from app.ingestion.parse_pdfs import PDFChunker
+
+ONNX_MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "ingestion", "onnx_model")
+
+
+class TestPDFChunker(unittest.TestCase):
+    def setUp(self):
+        self.chunker = PDFChunker(chunk_size=10, overlap=3)
+
+    def test_token_windows_overlap(self):
+        """Windows are chunk_size long, overlap by `overlap` tokens and stop at the last token."""
+        self.assertEqual(
+            list(self.chunker.token_windows(24)), [(0, 10), (7, 17), (14, 24)]
+        )
+        self.assertEqual(list(self.chunker.token_windows(5)), [(0, 5)])
+        self.assertEqual(list(self.chunker.token_windows(0)), [])
+
+    def test_overlap_must_be_smaller_than_chunk_size(self):
+        """An overlap that doesn't leave a positive stride is rejected up front."""
+        for overlap in (10, 12, -1):
+            with self.assertRaises(ValueError):
+                PDFChunker(chunk_size=10, overlap=overlap)
+
+    def test_chunk_monthly_data(self):
+        """Chunks drop the month header and respect the token budget."""
+        month_text = "January 2024 " + " ".join(f"txn{i} 12.50" for i in range(40))
+        chunks = self.chunker.chunk_monthly_data(month_text, "January 2024")
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0]["chunk_id"], "January 2024_chunk_1")
+        self.assertFalse(chunks[0]["text"].startswith("January 2024"))
+        for chunk in chunks:
+            self.assertEqual(chunk["month"], "January 2024")
+            self.assertLessEqual(chunk["token_count"], 10)
+
+    def test_processing_by_month_splits_on_headings(self):
+        """Each month-year heading starts a new month whose chunks exclude the heading."""
+        text = "Statement\nJanuary 2024\nRent 900.00\nFebruary 2024\nGroceries 120.40"
+        chunks = self.chunker.processing_by_month(text)
+
+        self.assertEqual([c["month"] for c in chunks], ["January 2024", "February 2024"])
+        self.assertEqual(chunks[0]["text"], "Rent 900.00")
+        self.assertEqual(chunks[1]["text"], "Groceries 120.40")
+
+
+@unittest.skipUnless(
+    os.path.exists(os.path.join(ONNX_MODEL_DIR, "model.int8.onnx"))
+    and importlib.util.find_spec("onnxruntime")
+    and importlib.util.find_spec("sentence_transformers"),
+    "Quantized ONNX model has not been exported",
+)
+class TestOnnxSentenceEncoder(unittest.TestCase):
+    def test_matches_sentence_transformer(self):
+        """The quantized encoder stays close to SentenceTransformer.encode."""
+        import numpy as np
+        from sentence_transformers import SentenceTransformer
+        from app.ingestion.onnx_encoder import OnnxSentenceEncoder
+
+        sentences = ["Movie tickets 450.00", "Biggest expense in August 2024"]
+        expected = SentenceTransformer("all-distilroberta-v1").encode(sentences, normalize_embeddings=True)
+        actual = OnnxSentenceEncoder(ONNX_MODEL_DIR).encode(sentences, normalize_embeddings=True)
+
+        self.assertEqual(actual.shape, expected.shape)
+        # int8 weights shift the vectors slightly; cosine similarity must stay high
+        self.assertTrue(np.all((actual * expected).sum(axis=1) > 0.98))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+import orjson
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app import main
+
+
+class TestChatEndpoints(unittest.TestCase):
+    def setUp(self):
+        main.sessions.clear()
+        main._SHARED_ANSWER_CACHE.clear()
+        main._SHARED_PLAN_CACHE.clear()
+        # Offline model cycling through plan, step result and final answer
+        llm = FakeListChatModel(responses=["step one", "result", "final answer"])
+        patcher = mock.patch.object(main, "_SHARED_LLM", llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(main.app)
+
+    def stream_events(self, payload: dict) -> list:
+        response = self.client.post("/chat/stream", json=payload)
+        response.raise_for_status()
+        return [
+            orjson.loads(line[len("data: "):])
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+
+    def test_first_turn_with_since_index_reports_context_reset(self):
+        """A session's first message with earlier client turns means the server lost them."""
+        reply = self.client.post(
+            "/chat", json={"message": "And last month?", "session_id": "s1", "since_index": 4}
+        ).json()
+        self.assertTrue(reply["context_reset"])
+
+        reply = self.client.post(
+            "/chat", json={"message": "And the month before?", "session_id": "s1", "since_index": 6}
+        ).json()
+        self.assertFalse(reply["context_reset"])
+
+    def test_stream_leads_with_context_reset_event(self):
+        """/chat/stream reports a lost session in a first event, then streams the tokens."""
+        events = self.stream_events({"message": "And last month?", "session_id": "s1", "since_index": 4})
+        self.assertEqual(events[0], {"context_reset": True})
+        self.assertEqual("".join(event["token"] for event in events[1:]), "final answer")
+
+        events = self.stream_events({"message": "What did I spend?", "session_id": "s2", "since_index": 0})
+        self.assertNotIn("context_reset", events[0])
+
+    def test_history_does_not_create_sessions(self):
+        """Reading an unknown session's history returns nothing and leaves the LRU alone."""
+        response = self.client.get("/history", headers={"X-Session-ID": "nobody"})
+        self.assertEqual(response.json(), {"history": []})
+        self.assertNotIn("nobody", main.sessions)
+
+
+if __name__ == "__main__":
+    unittest.main()